@@ -45,9 +45,5 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # CORS configuration
 CORS_ALLOW_ALL_ORIGINS = True
 
-# Channels settings
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
-    }
-}
+# No CHANNEL_LAYERS: each consumer only talks to its own Deepgram socket,
+# so no group messaging (and no per-consumer layer listener) is needed
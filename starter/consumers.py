@@ -2,7 +2,7 @@
 import os
 import json
 import asyncio
-from urllib.parse import parse_qs
+from urllib.parse import parse_qsl, urlencode
 from channels.generic.websocket import AsyncWebsocketConsumer
 import websockets
 from dotenv import load_dotenv
@@ -14,54 +14,67 @@ if not API_KEY:
 
 DEEPGRAM_STT_URL = "wss://api.deepgram.com/v1/listen"
 
+# Deepgram query parameters the client may set, with their defaults
+DEEPGRAM_OPTIONS = {
+    'model': 'nova-2',
+    'language': 'en',
+    'smart_format': 'true',
+    'interim_results': 'true',
+    'punctuate': 'true',
+    'encoding': 'linear16',
+    'sample_rate': '16000',
+}
+
+# Latency-related Deepgram query parameters, forwarded only when the client sets them
+DEEPGRAM_LATENCY_OPTIONS = ('no_delay', 'endpointing', 'utterance_end_ms', 'vad_events')
+
+# Max client messages buffered for Deepgram before receive() waits
+UPLINK_QUEUE_SIZE = 64
+
+# Deepgram closes streams that go ~10s without data; ping well inside that
+KEEPALIVE_INTERVAL = 8
+KEEPALIVE_MESSAGE = json.dumps({"type": "KeepAlive"})
+
 class LiveTranscriptionConsumer(AsyncWebsocketConsumer):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.deepgram_ws = None
         self.forward_task = None
-        self.stop_event = asyncio.Event()
+        self.uplink_task = None
+        self.keepalive_task = None
+        self.uplink_queue = asyncio.Queue(maxsize=UPLINK_QUEUE_SIZE)
+        self.closing = False
 
     async def connect(self):
         """Accept WebSocket connection from client"""
         await self.accept()
         print("Client connected to /api/live-transcription")
 
-        # Parse query parameters from scope
+        # Parse query parameters from scope, falling back to the defaults
         query_string = self.scope.get('query_string', b'').decode('utf-8')
-        params = parse_qs(query_string)
-
-        model = params.get('model', ['nova-2'])[0]
-        language = params.get('language', ['en'])[0]
-        smart_format = params.get('smart_format', ['true'])[0]
-        interim_results = params.get('interim_results', ['true'])[0]
-        punctuate = params.get('punctuate', ['true'])[0]
-        encoding = params.get('encoding', ['linear16'])[0]
-        sample_rate = params.get('sample_rate', ['16000'])[0]
+        params = dict(parse_qsl(query_string))
+        options = {key: params.get(key, default) for key, default in DEEPGRAM_OPTIONS.items()}
+        options.update((key, params[key]) for key in DEEPGRAM_LATENCY_OPTIONS if key in params)
 
         # Build Deepgram WebSocket URL with parameters
-        deepgram_url = (
-            f"{DEEPGRAM_STT_URL}?"
-            f"model={model}&"
-            f"language={language}&"
-            f"smart_format={smart_format}&"
-            f"interim_results={interim_results}&"
-            f"punctuate={punctuate}&"
-            f"encoding={encoding}&"
-            f"sample_rate={sample_rate}"
-        )
-
-        print(f"Connecting to Deepgram STT: model={model}, language={language}")
+        deepgram_url = f"{DEEPGRAM_STT_URL}?{urlencode(options)}"
+
+        print(f"Connecting to Deepgram STT: model={options['model']}, language={options['language']}")
 
         try:
-            # Connect to Deepgram
+            # Connect to Deepgram (no permessage-deflate: compressing encoded
+            # audio and small JSON frames costs CPU for almost no savings)
             self.deepgram_ws = await websockets.connect(
                 deepgram_url,
-                additional_headers={"Authorization": f"Token {API_KEY}"}
+                additional_headers={"Authorization": f"Token {API_KEY}"},
+                compression=None
             )
             print("✓ Connected to Deepgram STT API")
 
-            # Start forwarding task
+            # Start forwarding tasks
             self.forward_task = asyncio.create_task(self.forward_from_deepgram())
+            self.uplink_task = asyncio.create_task(self.forward_to_deepgram())
+            self.keepalive_task = asyncio.create_task(self.keep_alive())
 
         except Exception as e:
             print(f"Error connecting to Deepgram: {e}")
@@ -75,47 +88,98 @@ class LiveTranscriptionConsumer(AsyncWebsocketConsumer):
     async def disconnect(self, close_code):
         """Cleanup on disconnect"""
         print(f"Client disconnected: {close_code}")
-        self.stop_event.set()
+        self.closing = True
 
-        if self.forward_task:
-            self.forward_task.cancel()
-            try:
-                await self.forward_task
-            except asyncio.CancelledError:
-                pass
+        # Cancel every task first, then wait for all of them, so one task
+        # that failed can't stop the others or the Deepgram close below
+        tasks = [t for t in (self.forward_task, self.uplink_task, self.keepalive_task) if t]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
         if self.deepgram_ws:
             try:
-                await self.deepgram_ws.close()
+                await asyncio.shield(self.deepgram_ws.close())
             except Exception as e:
                 print(f"Error closing Deepgram connection: {e}")
 
+    async def close(self, code=None):
+        """Close the client connection once, whichever path asks first"""
+        if self.closing:
+            return
+        self.closing = True
+        try:
+            await super().close(code=code)
+        except Exception as e:
+            # The client transport is already gone
+            print(f"Error closing client connection: {e}")
+
     async def receive(self, text_data=None, bytes_data=None):
-        """Forward messages from client to Deepgram"""
-        if not self.deepgram_ws:
+        """Queue messages from client for Deepgram"""
+        if not self.deepgram_ws or self.closing:
             return
 
+        # Waiting on a full queue pushes back on the client socket
+        if bytes_data:
+            await self.uplink_queue.put(bytes_data)
+        elif text_data:
+            await self.uplink_queue.put(text_data)
+
+    async def forward_to_deepgram(self):
+        """Forward queued client messages to Deepgram"""
         try:
-            if text_data:
-                await self.deepgram_ws.send(text_data)
-            elif bytes_data:
-                await self.deepgram_ws.send(bytes_data)
+            while True:
+                message = await self.uplink_queue.get()
+
+                # Coalesce audio frames that queued up while the last send
+                # was in flight into one WebSocket frame, keeping control
+                # messages in order behind them
+                audio = []
+                while isinstance(message, bytes):
+                    audio.append(message)
+                    if self.uplink_queue.empty():
+                        message = None
+                        break
+                    message = self.uplink_queue.get_nowait()
+
+                if audio:
+                    await self.deepgram_ws.send(audio[0] if len(audio) == 1 else b"".join(audio))
+                if message is not None:
+                    await self.deepgram_ws.send(message)
+
+        except asyncio.CancelledError:
+            pass
         except Exception as e:
             print(f"Error forwarding to Deepgram: {e}")
             await self.close(code=3000)
 
+            # Nothing reads the queue any more; free a receive() blocked on put()
+            while not self.uplink_queue.empty():
+                self.uplink_queue.get_nowait()
+
+    async def keep_alive(self):
+        """Queue periodic KeepAlive messages so idle streams stay open"""
+        try:
+            while True:
+                await asyncio.sleep(KEEPALIVE_INTERVAL)
+                # Stop once either forwarding loop has ended
+                if self.closing or self.forward_task.done() or self.uplink_task.done():
+                    break
+                # A full queue means audio is flowing, which keeps the stream alive
+                if not self.uplink_queue.full():
+                    self.uplink_queue.put_nowait(KEEPALIVE_MESSAGE)
+        except asyncio.CancelledError:
+            pass
+
     async def forward_from_deepgram(self):
         """Forward messages from Deepgram to client"""
         try:
             async for message in self.deepgram_ws:
-                if self.stop_event.is_set():
+                if self.closing:
                     break
 
-                # Forward binary or text messages
-                if isinstance(message, bytes):
-                    await self.send(bytes_data=message)
-                else:
-                    await self.send(text_data=message)
+                # Deepgram STT only sends JSON text messages
+                await self.send(text_data=message)
 
         except websockets.exceptions.ConnectionClosed as e:
             print(f"Deepgram connection closed: {e.code} {e.reason}")
@@ -123,11 +187,15 @@ class LiveTranscriptionConsumer(AsyncWebsocketConsumer):
             pass
         except Exception as e:
             print(f"Error forwarding from Deepgram: {e}")
-            await self.send(text_data=json.dumps({
-                "type": "Error",
-                "description": str(e),
-                "code": "PROVIDER_ERROR"
-            }))
+            try:
+                await self.send(text_data=json.dumps({
+                    "type": "Error",
+                    "description": str(e),
+                    "code": "PROVIDER_ERROR"
+                }))
+            except Exception:
+                # Sending to the client failed, so its transport is closed
+                self.closing = True
         finally:
-            if not self.stop_event.is_set():
+            if not self.closing:
                 await self.close(code=1000)
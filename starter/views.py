@@ -1,12 +1,37 @@
 """HTTP views"""
-from django.http import JsonResponse
+import hashlib
+import json
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django.views.decorators.http import require_http_methods
 import toml
 
+METADATA_FILE = settings.BASE_DIR / 'deepgram.toml'
+
+# Serialized [meta] table and its ETag, loaded on first use
+_metadata = None
+
+def load_metadata():
+    """Return the [meta] table as (JSON bytes, ETag), reading deepgram.toml only once"""
+    global _metadata
+    if _metadata is None:
+        with open(METADATA_FILE, 'r') as f:
+            body = json.dumps(toml.load(f).get('meta', {})).encode('utf-8')
+        _metadata = (body, quote_etag(hashlib.sha1(body).hexdigest()))
+    return _metadata
+
 @require_http_methods(["GET"])
 def metadata(request):
     try:
-        with open('deepgram.toml', 'r') as f:
-            return JsonResponse(toml.load(f).get('meta', {}))
-    except:
+        body, etag = load_metadata()
+    except Exception:
         return JsonResponse({'error': 'Failed'}, status=500)
+
+    # 304 Not Modified when the client already has this version
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    return response